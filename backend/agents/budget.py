@@ -0,0 +1,56 @@
+"""Per-tick LLM token budget shared by all room agents."""
+import threading
+from typing import Optional, Sequence
+
+from langchain_core.messages import BaseMessage
+
+
+# Completion tokens assumed for a call whose reply length is not capped
+COMPLETION_TOKEN_ESTIMATE = 300
+
+
+def estimate_tokens(messages: Sequence[BaseMessage], max_completion_tokens: Optional[int] = None) -> int:
+    """Rough token estimate for a prompt plus its reply (~4 characters per token)."""
+    completion = COMPLETION_TOKEN_ESTIMATE if max_completion_tokens is None else max_completion_tokens
+    return sum(len(message.content) for message in messages) // 4 + completion
+
+
+class BudgetManager:
+    """
+    Track tokens spent during one analysis tick.
+
+    Calls reserve an estimate up front and reconcile it against the provider's
+    reported usage afterwards. Once the remaining budget would drop below
+    `warn_at`, every further reservation is refused and the agents fall back
+    to their heuristic (budget_level='low') behavior for the rest of the tick.
+    """
+
+    def __init__(self, max_tokens: int, warn_at: int = 0):
+        self.max_tokens = max_tokens
+        self.warn_at = warn_at
+        self.spent_tokens = 0
+        self.exhausted = False
+        self._lock = threading.Lock()
+
+    @property
+    def remaining(self) -> int:
+        """Tokens left before the budget is exhausted."""
+        return self.max_tokens - self.spent_tokens
+
+    def try_reserve(self, tokens: int) -> bool:
+        """Reserve tokens for a call; False means skip the LLM and use heuristics."""
+        with self._lock:
+            if self.exhausted:
+                return False
+            if self.remaining - tokens < self.warn_at:
+                self.exhausted = True
+                print(f"⚠️  Token budget nearly spent ({self.spent_tokens}/{self.max_tokens}), "
+                      f"switching remaining room agents to heuristics")
+                return False
+            self.spent_tokens += tokens
+            return True
+
+    def reconcile(self, reserved: int, actual: int):
+        """Replace a reservation with the tokens the call actually used."""
+        with self._lock:
+            self.spent_tokens += actual - reserved
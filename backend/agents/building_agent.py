@@ -1,11 +1,36 @@
 """Building Agent - aggregates room agents."""
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
+from collections import OrderedDict
 from datetime import datetime
+import re
 
-from langchain_groq import ChatGroq
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 
-from config import settings
+from .llm import get_llm, astream_matching_lines
+from .reducers import sum_columns
+
+
+# Invariant instructions kept as a fixed prefix so provider-side prompt caching can hit
+BUILDING_SYSTEM_PROMPT = """You are a building energy optimization agent. You will be given the current metrics, anomalies and room-level recommendations for one building.
+
+Generate 5 building-wide recommendations considering:
+1. Can we coordinate HVAC across floors?
+2. Should we close sections of the building?
+3. Are there load-balancing opportunities?
+4. Can we shift usage patterns?
+5. Emergency responses needed?
+
+Format: "BUILDING ACTION: [specific action] (estimated impact)"
+"""
+
+# Bump when the prompt or parsing changes so stale cached recommendations are ignored
+RECOMMENDATION_CACHE_VERSION = 2
+RECOMMENDATION_CACHE_SIZE = 256
+
+_NONE_LINE = "  None"
+
+# A recommendation line is tagged or at least quotes a percentage impact
+_BUILDING_RECOMMENDATION_RE = re.compile(r'BUILDING ACTION:|\d+\s*%')
 
 
 class BuildingAgent:
@@ -22,25 +47,36 @@ class BuildingAgent:
     def __init__(self, building_id: str, building_config: Dict[str, Any]):
         self.building_id = building_id
         self.building_config = building_config
-        self.llm = ChatGroq(
-            model=settings.agent_model,
-            temperature=settings.agent_temperature,
-            api_key=settings.groq_api_key
-        )
-        self.room_agents = {}
+        self.building_name = building_config.get('name', building_id)
+        self.llm = get_llm()
+        self._rec_cache: OrderedDict[Tuple, List[str]] = OrderedDict()
     
-    def add_room_agent(self, room_id: str, room_agent):
-        """Register a room agent to this building."""
-        self.room_agents[room_id] = room_agent
-    
-    def aggregate_building_state(self, room_states: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def aggregate_building_state(self, room_states: List[Dict[str, Any]], now: Optional[datetime] = None) -> Dict[str, Any]:
         """Aggregate all room states into building-level metrics."""
-        total_energy = sum(r.get('estimated_energy_kw', 0) for r in room_states)
-        total_water = sum(r.get('estimated_water_lph', 0) for r in room_states)
-        total_occupancy = sum(r.get('current_occupancy', 0) for r in room_states)
-        total_capacity = sum(r.get('capacity', 0) for r in room_states)
+        now = now or datetime.now()
+        
+        # Reduce the numeric room metrics in a single vectorized pass
+        energy_sum, water_sum, occupancy_sum, capacity_sum, co2_sum = sum_columns(
+            (
+                (
+                    r.get('estimated_energy_kw', 0),
+                    r.get('estimated_water_lph', 0),
+                    r.get('current_occupancy', 0),
+                    r.get('capacity', 0),
+                    r.get('estimated_co2_ppm', 400)
+                )
+                for r in room_states
+            ),
+            len(room_states),
+            5
+        )
+        
+        total_energy = float(energy_sum)
+        total_water = float(water_sum)
+        total_occupancy = int(occupancy_sum)
+        total_capacity = int(capacity_sum)
         
-        avg_co2 = sum(r.get('estimated_co2_ppm', 400) for r in room_states) / max(len(room_states), 1)
+        avg_co2 = float(co2_sum) / max(len(room_states), 1)
         
         # Aggregate anomalies
         all_anomalies = []
@@ -58,7 +94,7 @@ class BuildingAgent:
         
         return {
             "building_id": self.building_id,
-            "building_name": self.building_config.get('name', self.building_id),
+            "building_name": self.building_name,
             "total_rooms": len(room_states),
             "total_energy_kw": round(total_energy, 2),
             "total_water_lph": round(total_water, 2),
@@ -69,47 +105,78 @@ class BuildingAgent:
             "room_states": room_states,
             "anomalies": all_anomalies,
             "room_recommendations": all_recommendations,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now.isoformat()
         }
     
-    def generate_building_recommendations(self, building_state: Dict[str, Any]) -> List[str]:
+    async def generate_building_recommendations_async(self, building_state: Dict[str, Any]) -> List[str]:
         """Generate building-level optimization recommendations using LLM."""
-        prompt = f"""
-You are optimizing {building_state['building_name']} with {building_state['total_rooms']} rooms.
+        key = self._recommendation_cache_key(building_state)
+        cached = self._get_cached_recommendations(key)
+        if cached is not None:
+            return cached
+        
+        recommendations = await astream_matching_lines(
+            self.llm,
+            self._build_recommendation_messages(building_state),
+            self._is_recommendation_line,
+            5
+        )
+        self._cache_recommendations(key, recommendations)
+        return recommendations
+    
+    def _recommendation_cache_key(self, building_state: Dict[str, Any]) -> Tuple:
+        """Quantize building metrics so near-identical ticks share a cache entry."""
+        return (
+            RECOMMENDATION_CACHE_VERSION,
+            self.building_id,
+            round(building_state['total_energy_kw'], 0),
+            round(building_state['occupancy_rate'], -1),
+            building_state['avg_co2_ppm'] // 50,
+            tuple(sorted(building_state.get('anomalies', [])[:5]))
+        )
+    
+    def _get_cached_recommendations(self, key: Tuple) -> Optional[List[str]]:
+        """Return cached recommendations for a quantized state, if any."""
+        recommendations = self._rec_cache.get(key)
+        if recommendations is None:
+            return None
+        self._rec_cache.move_to_end(key)
+        return list(recommendations)
+    
+    def _cache_recommendations(self, key: Tuple, recommendations: List[str]):
+        """Store recommendations, evicting the least recently used entry."""
+        self._rec_cache[key] = list(recommendations)
+        if len(self._rec_cache) > RECOMMENDATION_CACHE_SIZE:
+            self._rec_cache.popitem(last=False)
+    
+    def _build_recommendation_messages(self, building_state: Dict[str, Any]) -> List[BaseMessage]:
+        """Build the static system prompt plus the per-building metrics message."""
+        metrics = f"""
+Building: {building_state['building_name']} ({building_state['total_rooms']} rooms)
 
 Current Building Metrics:
-- Total Energy: {building_state['total_energy_kw']} kW
-- Total Water: {building_state['total_water_lph']} L/h
-- Occupancy: {building_state['total_occupancy']}/{building_state['total_capacity']} ({building_state['occupancy_rate']}%)
+- Total Energy: {building_state['total_energy_kw']:.2f} kW
+- Total Water: {building_state['total_water_lph']:.2f} L/h
+- Occupancy: {building_state['total_occupancy']}/{building_state['total_capacity']} ({building_state['occupancy_rate']:.1f}%)
 - Average CO2: {building_state['avg_co2_ppm']} ppm
 
 Building-Level Anomalies:
-{self._format_list(building_state.get('anomalies', [])[:5])}
+{self._format_list(building_state.get('anomalies', []))}
 
 Room-Level Recommendations:
-{self._format_list(building_state.get('room_recommendations', [])[:5])}
-
-Generate 5 building-wide recommendations considering:
-1. Can we coordinate HVAC across floors?
-2. Should we close sections of the building?
-3. Are there load-balancing opportunities?
-4. Can we shift usage patterns?
-5. Emergency responses needed?
-
-Format: "BUILDING ACTION: [specific action] (estimated impact)"
+{self._format_list(building_state.get('room_recommendations', []))}
 """
-        
-        response = self.llm.invoke([HumanMessage(content=prompt)])
-        
-        recommendations = []
-        for line in response.content.split('\n'):
-            if 'BUILDING ACTION:' in line or any(c.isdigit() and '%' in line for c in line):
-                recommendations.append(line.strip())
-        
-        return recommendations[:5]
+        return [SystemMessage(content=BUILDING_SYSTEM_PROMPT), HumanMessage(content=metrics)]
     
-    def calculate_building_savings(self, building_state: Dict[str, Any]) -> Dict[str, float]:
+    @staticmethod
+    def _is_recommendation_line(line: str) -> bool:
+        """Whether a response line is a building recommendation."""
+        return _BUILDING_RECOMMENDATION_RE.search(line) is not None
+    
+    def calculate_building_savings(self, building_state: Dict[str, Any], now: Optional[datetime] = None) -> Dict[str, float]:
         """Calculate potential savings at building level."""
+        now = now or datetime.now()
+        
         room_savings = [r.get('savings_potential', 0) for r in building_state['room_states']]
         avg_room_savings = sum(room_savings) / max(len(room_savings), 1)
         
@@ -121,7 +188,7 @@ Format: "BUILDING ACTION: [specific action] (estimated impact)"
             building_coordination_savings += 10.0
         
         # Time-based savings
-        hour = datetime.now().hour
+        hour = now.hour
         if hour > 20 or hour < 6:  # Night hours
             building_coordination_savings += 15.0
         
@@ -135,25 +202,23 @@ Format: "BUILDING ACTION: [specific action] (estimated impact)"
             "estimated_water_saved_lph": round(building_state['total_water_lph'] * total_savings_potential / 100, 2)
         }
     
-    def _format_list(self, items: List[str]) -> str:
-        """Format list for LLM prompt."""
+    def _format_list(self, items: List[str], limit: int = 5) -> str:
+        """Format the first `limit` items as a bulleted list for the LLM prompt."""
         if not items:
-            return "  None"
-        return "\n".join([f"  - {item}" for item in items])
+            return _NONE_LINE
+        return "\n".join("  - " + item for item in items[:limit])
     
-    def analyze_building(self, room_states: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Complete building analysis pipeline."""
-        # Aggregate state
-        building_state = self.aggregate_building_state(room_states)
-        
-        # Generate recommendations
-        building_recommendations = self.generate_building_recommendations(building_state)
-        
-        # Calculate savings
-        savings = self.calculate_building_savings(building_state)
-        
-        # Combine results
-        building_state['building_recommendations'] = building_recommendations
-        building_state['savings_analysis'] = savings
+    async def analyze_building_async(self, room_states: List[Dict[str, Any]], now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Complete building analysis pipeline.
+        
+        Args:
+            room_states: Analyzed states of the rooms in this building
+            now: Analysis tick time shared by all buildings (defaults to now)
+        """
+        now = now or datetime.now()
+        building_state = self.aggregate_building_state(room_states, now)
+        building_state['building_recommendations'] = await self.generate_building_recommendations_async(building_state)
+        building_state['savings_analysis'] = self.calculate_building_savings(building_state, now)
         
         return building_state
@@ -0,0 +1,69 @@
+"""Shared Groq chat client for all agents."""
+from functools import lru_cache
+from typing import Callable, List, Sequence
+
+import httpx
+from groq import DefaultAsyncHttpxClient, DefaultHttpxClient
+from langchain_core.messages import BaseMessage
+from langchain_groq import ChatGroq
+
+from config import get_settings
+
+
+@lru_cache(maxsize=1)
+def get_llm() -> ChatGroq:
+    """Return the process-wide ChatGroq client, creating it on first use."""
+    settings = get_settings()
+    
+    # One keep-alive pool shared by the agents, the batch runner and chat
+    limits = httpx.Limits(
+        max_connections=settings.llm_max_connections,
+        max_keepalive_connections=settings.llm_max_keepalive_connections
+    )
+    return ChatGroq(
+        model=settings.agent_model,
+        temperature=settings.agent_temperature,
+        api_key=settings.groq_api_key,
+        max_retries=settings.llm_max_retries,
+        http_client=DefaultHttpxClient(limits=limits),
+        http_async_client=DefaultAsyncHttpxClient(limits=limits)
+    )
+
+
+def _take_complete_lines(buffer: str, predicate: Callable[[str], bool], matches: List[str], limit: int) -> str:
+    """Move matching complete lines from buffer into matches; return the unfinished tail."""
+    *lines, tail = buffer.split('\n')
+    for line in lines:
+        if predicate(line):
+            matches.append(line.strip())
+            if len(matches) >= limit:
+                break
+    return tail
+
+
+async def astream_matching_lines(
+    llm: ChatGroq,
+    messages: Sequence[BaseMessage],
+    predicate: Callable[[str], bool],
+    limit: int
+) -> List[str]:
+    """
+    Stream a response and collect up to `limit` lines accepted by `predicate`.
+    
+    The stream is closed as soon as enough lines have been collected, so the
+    model stops generating tokens we would discard anyway.
+    """
+    matches: List[str] = []
+    buffer = ""
+    stream = llm.astream(messages)
+    try:
+        async for chunk in stream:
+            buffer = _take_complete_lines(buffer + chunk.content, predicate, matches, limit)
+            if len(matches) >= limit:
+                return matches[:limit]
+    finally:
+        await stream.aclose()
+    
+    if predicate(buffer):
+        matches.append(buffer.strip())
+    return matches[:limit]
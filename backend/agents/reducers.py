@@ -0,0 +1,24 @@
+"""Vectorized numeric reductions shared by building and campus aggregation."""
+from typing import Iterable, Sequence
+
+import numpy as np
+
+
+def sum_columns(rows: Iterable[Sequence[float]], num_rows: int, num_columns: int) -> np.ndarray:
+    """
+    Sum fixed-width numeric rows column-wise in a single pass.
+    
+    Args:
+        rows: Iterable yielding one tuple of numbers per record
+        num_rows: Number of rows the iterable yields
+        num_columns: Width of every row
+    
+    Returns:
+        Array of length num_columns with the per-column totals
+    """
+    values = np.fromiter(
+        (value for row in rows for value in row),
+        dtype=np.float64,
+        count=num_rows * num_columns
+    )
+    return values.reshape(num_rows, num_columns).sum(axis=0)
@@ -1,21 +1,172 @@
-"""Room Agent using LangGraph for stateful resource management."""
-from typing import TypedDict, Annotated, Sequence, List, Dict, Any
-from datetime import datetime
-import operator
+"""Room agents: per-room reasoning steps, run in batches across rooms."""
+from collections import ChainMap
+from operator import itemgetter
+from types import MappingProxyType
+from typing import TypedDict, Sequence, List, Dict, Any, Optional, Tuple
+import asyncio
+import re
 
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
 from langchain_groq import ChatGroq
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
-from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode
 
-from config import settings
+from .budget import BudgetManager, estimate_tokens
+from .llm import get_llm
+from .vector_ops import (
+    BASE_ENERGY_BY_TYPE,
+    Comfort,
+    RoomBatch,
+    RoomType,
+    by_room_type,
+    demand_predictions_all,
+    resource_estimates_all,
+    savings_potentials_all
+)
+
+
+# Per-room-type lookup tables, built once at import and read-only thereafter
+_ROOM_PROFILES = MappingProxyType({
+    "classroom": "Scheduled usage, 9AM-5PM peaks, equipment varies by class",
+    "lab": "High baseline energy, specialized equipment, irregular hours",
+    "library": "Steady occupancy, long sessions, quiet hours after 10PM",
+    "dorm": "Residential 24/7, evening/night peaks, personal electronics",
+    "bathroom": "Short visits, water-centric, hygiene equipment",
+    "cafeteria": "Meal-time peaks (7-9AM, 12-2PM, 6-8PM), high water/energy"
+})
+
+# Fields most prompts and heuristics read, fetched in one call
+_ROOM_FIELDS = itemgetter('room_id', 'room_type', 'current_occupancy', 'capacity', 'temperature_comfort')
+_ESTIMATE_FIELDS = itemgetter('estimated_energy_kw', 'estimated_water_lph', 'estimated_co2_ppm', 'thermal_load')
+
+_ANOMALY_RE = re.compile(r'unusual|anomaly|unexpected|high|waste', re.IGNORECASE)
+_RECOMMENDATION_RE = re.compile(r'ACTION:|\d+\s*%')
+
+# Static instructions shared by every room prompt; only the human message varies per room,
+# so the provider can reuse the cached system prefix across rooms and ticks
+ROOM_SYSTEM_PROMPT = """You are an energy optimization expert reasoning about a single room on a campus.
+
+Room Type Profiles (expected behavior):
+""" + "\n".join(f"- {room_type}: {profile}" for room_type, profile in _ROOM_PROFILES.items()) + """
+
+Each request names one task:
+
+ANALYZE: Analyze if current conditions are normal or anomalous for this room type and time.
+
+REFINE: Based on the room analysis, consider:
+1. Are these estimates realistic for this room type?
+2. Are there hidden energy loads (HVAC working harder due to discomfort)?
+3. Any unusual patterns?
+Provide refined estimates with brief reasoning.
+
+PREDICT: Predict:
+1. Occupancy in 1 hour
+2. Energy demand in 1 hour
+3. Peak usage time today
+Consider: day of week, time of day, room type typical schedule.
+Provide numeric predictions.
+
+RECOMMEND: Generate 3-5 specific recommendations:
+1. Immediate actions (next 1 hour)
+2. Energy/water savings opportunities
+3. Comfort improvements
+4. Predictive adjustments
+Format each as: "ACTION: specific recommendation (estimated X% savings)\""""
+
+# Typical occupancy ratio per room type for (9-17h, 17-22h, night)
+_EXPECTED_OCCUPANCY = MappingProxyType({
+    "classroom": (0.6, 0.1, 0.0),
+    "lab": (0.4, 0.2, 0.05),
+    "library": (0.4, 0.5, 0.1),
+    "dorm": (0.3, 0.7, 0.8),
+    "bathroom": (0.2, 0.1, 0.05),
+    "cafeteria": (0.4, 0.3, 0.0)
+})
+
+# Advisory LLM calls skipped because the room looked normal (process-wide, for observability)
+_skipped_llm_calls = 0
+
+
+def get_skipped_llm_calls() -> int:
+    """Number of room LLM calls skipped so far for rooms in a normal state."""
+    return _skipped_llm_calls
+
+
+_EXPECTED_OCCUPANCY_BY_TYPE = by_room_type(_EXPECTED_OCCUPANCY, (0.4, 0.2, 0.05))
+
+
+def _expected_occupancy_ratio(room_type_id: int, hour: int) -> float:
+    """Typical occupancy ratio for a room type at the given hour."""
+    day, evening, night = _EXPECTED_OCCUPANCY_BY_TYPE[room_type_id]
+    if 9 <= hour < 17:
+        return day
+    if 17 <= hour < 22:
+        return evening
+    return night
+
+
+# Each step appends its prompt and response; the prompts themselves never replay history
+MESSAGE_HISTORY_LIMIT = 6
+
+_ROOM_SYSTEM_MESSAGE = SystemMessage(content=ROOM_SYSTEM_PROMPT)
+
+# Reply length caps per step; the parsers only keep the top 3-5 lines anyway
+STEP_MAX_TOKENS = MappingProxyType({
+    "observations": 150,
+    "inference": 200,
+    "prediction": 150,
+    "recommendations": 150
+})
+_RUNAWAY_STOP = ["\n\n\n"]
+
+
+def _with_system_prompt(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """Prefix a room prompt with the shared system message."""
+    return [_ROOM_SYSTEM_MESSAGE, *messages]
+
+
+async def _invoke_within_budget(
+    llm: ChatGroq,
+    prompt: List[BaseMessage],
+    budget: Optional[BudgetManager],
+    step: str
+) -> Optional[AIMessage]:
+    """Call the LLM on a room step's prompt, or return None if the token budget refuses it."""
+    messages = _with_system_prompt(prompt)
+    max_tokens = STEP_MAX_TOKENS[step]
+    if budget is None:
+        return await llm.ainvoke(messages, stop=_RUNAWAY_STOP, max_tokens=max_tokens)
+    
+    reserved = estimate_tokens(messages, max_tokens)
+    if not budget.try_reserve(reserved):
+        return None
+    
+    try:
+        response = await llm.ainvoke(messages, stop=_RUNAWAY_STOP, max_tokens=max_tokens)
+    except Exception:
+        budget.reconcile(reserved, 0)
+        raise
+    
+    usage = response.usage_metadata
+    budget.reconcile(reserved, usage['total_tokens'] if usage else reserved)
+    return response
+
+
+def _cap(existing: Sequence[BaseMessage], new: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """Append new messages, keeping only the last MESSAGE_HISTORY_LIMIT."""
+    return (list(existing) + list(new))[-MESSAGE_HISTORY_LIMIT:]
 
 
 class RoomState(TypedDict):
-    """State structure for a room agent."""
+    """
+    State structure for a room agent.
+    
+    A TypedDict is a plain dict at runtime, which is what the batch runner
+    merges step updates into; numeric aggregation over many rooms goes through
+    agents.reducers rather than through per-room attribute access.
+    """
     # Room Identity
     room_id: str
     room_type: str  # classroom, lab, library, dorm, bathroom, cafeteria
+    room_type_id: int  # RoomType, translated from room_type once at ingress
     building_id: str
     floor: int
     capacity: int
@@ -24,6 +175,7 @@ class RoomState(TypedDict):
     current_occupancy: int
     occupancy_level: str  # low, medium, high
     temperature_comfort: str  # too_cold, comfortable, too_hot
+    comfort_id: int  # Comfort, translated from temperature_comfort once at ingress
     equipment_running: List[str]  # e.g., ["projector", "computers", "lights"]
     water_running: bool
     
@@ -49,334 +201,200 @@ class RoomState(TypedDict):
     savings_potential: float  # percentage
     
     # Agent Communication
-    messages: Annotated[Sequence[BaseMessage], operator.add]
+    messages: List[BaseMessage]  # recent turns (capped by _cap), for traceability only
     
     # Metadata
+    tick_ts: str  # ISO timestamp of the analysis tick, set once by the orchestrator
+    tick_hour: int  # Hour of tick_ts, used by the time-of-day heuristics
     last_updated: str
 
 
 class RoomAgent:
     """
-    Intelligent room agent using LangGraph.
+    Intelligent room agent.
     
     Each room has its own agent that:
     1. Analyzes current state from observations
     2. Infers hidden variables (energy, CO2, water)
     3. Predicts future demand
     4. Generates optimization recommendations
+    
+    The agent builds each step's prompt and applies its result; the steps are
+    run by RoomAgentBatchRunner, which batches them across rooms. Steps 1-3
+    only depend on the observations and run together before step 4.
     """
     
     def __init__(self, room_id: str, room_config: Dict[str, Any]):
         self.room_id = room_id
         self.room_config = room_config
-        self.budget_level = 'medium'  # Default budget level
-        self.llm = ChatGroq(
-            model=settings.agent_model,
-            temperature=settings.agent_temperature,
-            api_key=settings.groq_api_key
-        )
-        self.graph = self._build_graph()
-    
-    def _build_graph(self) -> StateGraph:
-        """Build the agent's reasoning graph."""
-        workflow = StateGraph(RoomState)
-        
-        # Add nodes for different reasoning steps
-        workflow.add_node("analyze_observations", self._analyze_observations)
-        workflow.add_node("infer_resources", self._infer_resources)
-        workflow.add_node("predict_demand", self._predict_demand)
-        workflow.add_node("generate_recommendations", self._generate_recommendations)
-        
-        # Define the flow
-        workflow.set_entry_point("analyze_observations")
-        workflow.add_edge("analyze_observations", "infer_resources")
-        workflow.add_edge("infer_resources", "predict_demand")
-        workflow.add_edge("predict_demand", "generate_recommendations")
-        workflow.add_edge("generate_recommendations", END)
-        
-        return workflow.compile()
     
-    def _analyze_observations(self, state: RoomState) -> RoomState:
-        """Analyze current room observations."""
+    # Step prompts and result handling, driven by RoomAgentBatchRunner
+    def _observation_messages(self, state: RoomState, budget_level: str) -> Optional[List[BaseMessage]]:
+        """Prompt for anomaly analysis, or None when the budget skips the LLM."""
         # For low budget, skip LLM and use heuristics only
-        if self.budget_level == 'low':
-            # Simple heuristic-based anomaly detection
-            anomalies = []
-            if state['temperature_comfort'] != 'comfortable':
-                anomalies.append(f"Temperature discomfort: {state['temperature_comfort']}")
-            if state['current_occupancy'] < state['capacity'] * 0.2 and len(state.get('equipment_running', [])) > 2:
-                anomalies.append(f"Low occupancy ({state['current_occupancy']}) but multiple equipment running")
-            
-            return {
-                **state,
-                "anomalies": anomalies,
-                "last_updated": datetime.now().isoformat()
-            }
+        if budget_level == 'low' or self._skip_llm(state, budget_level):
+            return None
         
-        # For medium/high budget, use LLM
-        # Build context for LLM
+        room_id, room_type, occupancy, capacity, comfort = _ROOM_FIELDS(state)
+        equipment = state['equipment_running']
         context = f"""
-You are analyzing room {state['room_id']} ({state['room_type']}).
+Task: ANALYZE room {room_id} ({room_type}).
 
 Current Observations:
-- Occupancy: {state['current_occupancy']}/{state['capacity']} ({state['occupancy_level']})
-- Temperature: {state['temperature_comfort']}
-- Equipment: {', '.join(state['equipment_running']) if state['equipment_running'] else 'None'}
+- Occupancy: {occupancy}/{capacity} ({state['occupancy_level']})
+- Temperature: {comfort}
+- Equipment: {', '.join(equipment) if equipment else 'None'}
 - Water: {'Running' if state.get('water_running', False) else 'Off'}
-
-Room Type Profile: {self._get_room_type_profile(state['room_type'])}
-
-Task: Analyze if current conditions are normal or anomalous for this room type and time.
 """
-        
-        messages = list(state.get("messages", []))
-        messages.append(HumanMessage(content=context))
-        
-        response = self.llm.invoke(messages)
-        messages.append(response)
-        
-        # Parse anomalies from response
-        anomalies = self._extract_anomalies(response.content)
+        return [HumanMessage(content=context)]
+    
+    def _apply_observation_analysis(self, state: RoomState, llm_response: Optional[str]) -> Dict[str, Any]:
+        """State update from the anomaly analysis (heuristic when there is no LLM response)."""
+        if llm_response is not None:
+            anomalies = self._extract_anomalies(llm_response)
+        else:
+            anomalies = self._heuristic_anomalies(state)
         
         return {
-            **state,
-            "messages": messages,
             "anomalies": anomalies,
-            "last_updated": datetime.now().isoformat()
+            "last_updated": state['tick_ts']
         }
     
-    def _infer_resources(self, state: RoomState) -> RoomState:
-        """Infer energy, water, CO2 from observations."""
-        room_type = state['room_type']
-        occupancy = state['current_occupancy']
-        equipment = state.get('equipment_running', [])
-        
-        # Base inference logic (can be enhanced with LLM)
-        energy_kw = self._calculate_energy(room_type, occupancy, equipment)
-        water_lph = self._calculate_water(room_type, state.get('water_running', False))
-        co2_ppm = self._calculate_co2(occupancy, state['capacity'])
-        thermal_load = self._determine_thermal_load(state['temperature_comfort'])
+    @staticmethod
+    def _heuristic_anomalies(state: RoomState) -> List[str]:
+        """Simple heuristic-based anomaly detection."""
+        _, _, occupancy, capacity, comfort = _ROOM_FIELDS(state)
+        anomalies = []
+        if state['comfort_id'] != Comfort.COMFORTABLE:
+            anomalies.append(f"Temperature discomfort: {comfort}")
+        if occupancy < capacity * 0.2 and len(state.get('equipment_running', [])) > 2:
+            anomalies.append(f"Low occupancy ({occupancy}) but multiple equipment running")
+        return anomalies
+    
+    def _needs_llm(self, state: RoomState) -> bool:
+        """Whether the room looks unusual enough to be worth LLM analysis."""
+        if self._heuristic_anomalies(state):
+            return True
         
-        # Use LLM for context-aware inference
+        occupancy_ratio = state['current_occupancy'] / max(state['capacity'], 1)
+        return abs(occupancy_ratio - _expected_occupancy_ratio(state['room_type_id'], state['tick_hour'])) >= 0.2
+    
+    def _skip_llm(self, state: RoomState, budget_level: str) -> bool:
+        """Below high budget, skip advisory LLM calls for normal rooms (and count them)."""
+        global _skipped_llm_calls
+        if budget_level == 'high' or self._needs_llm(state):
+            return False
+        _skipped_llm_calls += 1
+        return True
+    
+    def _inference_messages(
+        self,
+        state: RoomState,
+        estimates: Dict[str, Any],
+        budget_level: str
+    ) -> Optional[List[BaseMessage]]:
+        """Prompt asking the LLM to sanity-check the heuristic resource estimates, or None for normal rooms."""
+        if self._skip_llm(state, budget_level):
+            return None
+        
+        _, room_type, occupancy, capacity, comfort = _ROOM_FIELDS(state)
+        equipment = state.get('equipment_running', [])
+        energy_kw, water_lph, co2_ppm, thermal_load = _ESTIMATE_FIELDS(estimates)
         inference_prompt = f"""
-Based on the room analysis, refine these resource estimates:
+Task: REFINE these resource estimates.
 
-Room: {state['room_type']} with {occupancy} people (capacity: {state['capacity']})
+Room: {room_type} with {occupancy} people (capacity: {capacity})
 Equipment: {', '.join(equipment) if equipment else 'None'}
-Temperature: {state['temperature_comfort']}
+Temperature: {comfort}
 
 Initial Estimates:
 - Energy: {energy_kw:.2f} kW
 - Water: {water_lph:.2f} L/h
 - CO2: {co2_ppm} ppm
 - Thermal Load: {thermal_load}
-
-Consider:
-1. Are these estimates realistic for this room type?
-2. Are there hidden energy loads (HVAC working harder due to discomfort)?
-3. Any unusual patterns?
-
-Provide refined estimates with brief reasoning.
 """
-        
-        messages = list(state.get("messages", []))
-        messages.append(HumanMessage(content=inference_prompt))
-        
-        response = self.llm.invoke(messages)
-        messages.append(response)
-        
-        return {
-            **state,
-            "estimated_energy_kw": energy_kw,
-            "estimated_water_lph": water_lph,
-            "estimated_co2_ppm": co2_ppm,
-            "thermal_load": thermal_load,
-            "messages": messages
-        }
+        return [HumanMessage(content=inference_prompt)]
     
-    def _predict_demand(self, state: RoomState) -> RoomState:
-        """Predict future resource demand."""
-        current_time = datetime.now()
-        hour = current_time.hour
+    def _prediction_messages(self, state: RoomState) -> List[BaseMessage]:
+        """Prompt for the 1-hour demand prediction."""
+        _, room_type, occupancy, _, _ = _ROOM_FIELDS(state)
+        hour = state['tick_hour']
+        
+        # Sent in the same step as the inference prompt, so estimate current energy locally
+        energy_kw = self._calculate_energy(state['room_type_id'], occupancy, state.get('equipment_running', []))
         
         # Use historical patterns + LLM reasoning
         prediction_prompt = f"""
-Predict resource demand for the next 1 hour.
+Task: PREDICT resource demand for the next 1 hour.
 
 Current State (at {hour}:00):
-- Occupancy: {state['current_occupancy']} ({state['occupancy_level']})
-- Energy: {state['estimated_energy_kw']:.2f} kW
-- Room Type: {state['room_type']}
+- Occupancy: {occupancy} ({state['occupancy_level']})
+- Energy: {energy_kw:.2f} kW
+- Room Type: {room_type}
 
 Historical Pattern (last 24h):
 {self._format_history(state.get('occupancy_history', []))}
-
-Predict:
-1. Occupancy in 1 hour
-2. Energy demand in 1 hour  
-3. Peak usage time today
-
-Consider: day of week, time of day, room type typical schedule.
-Provide numeric predictions.
 """
-        
-        messages = list(state.get("messages", []))
-        messages.append(HumanMessage(content=prediction_prompt))
-        
-        response = self.llm.invoke(messages)
-        messages.append(response)
-        
-        # Simple heuristic prediction (enhance with LLM parsing)
-        predicted_occupancy = self._predict_occupancy_heuristic(state)
-        predicted_energy = predicted_occupancy / state['capacity'] * self._get_max_energy(state['room_type'])
-        
-        return {
-            **state,
-            "predicted_occupancy_1h": predicted_occupancy,
-            "predicted_energy_1h": predicted_energy,
-            "predicted_peak_time": self._find_peak_time(state),
-            "messages": messages
-        }
+        return [HumanMessage(content=prediction_prompt)]
     
-    def _generate_recommendations(self, state: RoomState) -> RoomState:
-        """Generate optimization recommendations."""
+    def _recommendation_messages(self, state: RoomState, budget_level: str) -> Optional[List[BaseMessage]]:
+        """Prompt for recommendations, or None when the budget uses rules only."""
         # For low budget, use simple rule-based recommendations
-        if self.budget_level == 'low':
+        if budget_level == 'low':
+            return None
+        
+        room_id, room_type, occupancy, capacity, comfort = _ROOM_FIELDS(state)
+        anomalies = state['anomalies']
+        recommendation_prompt = f"""
+Task: RECOMMEND actions for this room.
+
+Room Analysis Summary:
+- Room: {room_id} ({room_type})
+- Current Energy: {state['estimated_energy_kw']:.2f} kW
+- Predicted 1h: {state['predicted_energy_1h']:.2f} kW
+- Comfort: {comfort}
+- Occupancy: {occupancy}/{capacity}
+- Anomalies: {', '.join(anomalies) if anomalies else 'None'}
+"""
+        return [HumanMessage(content=recommendation_prompt)]
+    
+    def _apply_recommendations(self, state: RoomState, llm_response: Optional[str]) -> Dict[str, Any]:
+        """State update from the recommendation step (rule-based when there is no LLM response)."""
+        if llm_response is not None:
+            recommendations = self._parse_recommendations(llm_response)
+        else:
+            _, _, occupancy, capacity, _ = _ROOM_FIELDS(state)
             recommendations = []
             
-            if state['temperature_comfort'] != 'comfortable':
+            if state['comfort_id'] != Comfort.COMFORTABLE:
                 recommendations.append(f"ACTION: Adjust HVAC to reach comfortable temperature (est. 10% savings)")
             
-            occupancy_ratio = state['current_occupancy'] / max(state['capacity'], 1)
+            occupancy_ratio = occupancy / max(capacity, 1)
             if occupancy_ratio < 0.3 and state['estimated_energy_kw'] > 2.0:
                 recommendations.append(f"ACTION: Reduce lighting and equipment in low-occupancy room (est. 15% savings)")
             
-            if state.get('water_running') and state['room_type'] not in ['bathroom', 'cafeteria']:
+            if state.get('water_running') and state['room_type_id'] not in (RoomType.BATHROOM, RoomType.CAFETERIA):
                 recommendations.append(f"ACTION: Check for water leaks or unnecessary usage (est. 20% savings)")
             
             if not recommendations:
                 recommendations.append("No immediate actions needed - room operating efficiently")
-            
-            savings_potential = self._calculate_savings_potential(state)
-            
-            return {
-                **state,
-                "recommendations": recommendations,
-                "savings_potential": savings_potential
-            }
-        
-        # For medium/high budget, use LLM
-        recommendation_prompt = f"""
-You are an energy optimization expert. Generate actionable recommendations.
-
-Room Analysis Summary:
-- Room: {state['room_id']} ({state['room_type']})
-- Current Energy: {state['estimated_energy_kw']:.2f} kW
-- Predicted 1h: {state['predicted_energy_1h']:.2f} kW
-- Comfort: {state['temperature_comfort']}
-- Occupancy: {state['current_occupancy']}/{state['capacity']}
-- Anomalies: {', '.join(state['anomalies']) if state['anomalies'] else 'None'}
-
-Generate 3-5 specific recommendations:
-1. Immediate actions (next 1 hour)
-2. Energy/water savings opportunities
-3. Comfort improvements
-4. Predictive adjustments
-
-Format each as: "ACTION: specific recommendation (estimated X% savings)"
-"""
-        
-        messages = list(state.get("messages", []))
-        messages.append(HumanMessage(content=recommendation_prompt))
         
-        response = self.llm.invoke(messages)
-        messages.append(response)
-        
-        # Parse recommendations
-        recommendations = self._parse_recommendations(response.content)
-        savings_potential = self._calculate_savings_potential(state)
-        
-        return {
-            **state,
-            "recommendations": recommendations,
-            "savings_potential": savings_potential,
-            "messages": messages
-        }
+        return {"recommendations": recommendations}
     
     # Helper methods
-    def _get_room_type_profile(self, room_type: str) -> str:
-        """Get expected behavior profile for room type."""
-        profiles = {
-            "classroom": "Scheduled usage, 9AM-5PM peaks, equipment varies by class",
-            "lab": "High baseline energy, specialized equipment, irregular hours",
-            "library": "Steady occupancy, long sessions, quiet hours after 10PM",
-            "dorm": "Residential 24/7, evening/night peaks, personal electronics",
-            "bathroom": "Short visits, water-centric, hygiene equipment",
-            "cafeteria": "Meal-time peaks (7-9AM, 12-2PM, 6-8PM), high water/energy"
-        }
-        return profiles.get(room_type, "General purpose space")
-    
-    def _calculate_energy(self, room_type: str, occupancy: int, equipment: List[str]) -> float:
-        """Calculate estimated energy consumption."""
-        base_energy = {
-            "classroom": 2.0,
-            "lab": 8.0,
-            "library": 3.0,
-            "dorm": 1.5,
-            "bathroom": 1.0,
-            "cafeteria": 15.0
-        }.get(room_type, 2.0)
-        
-        # Add equipment load
-        equipment_load = len(equipment) * 0.5
-        
-        # Add occupancy factor
-        occupancy_load = occupancy * 0.1
-        
-        return base_energy + equipment_load + occupancy_load
+    @staticmethod
+    def _calculate_energy(room_type_id: int, occupancy: int, equipment: List[str]) -> float:
+        """Calculate estimated energy consumption (base + equipment load + occupancy factor)."""
+        return BASE_ENERGY_BY_TYPE[room_type_id] + len(equipment) * 0.5 + occupancy * 0.1
     
-    def _calculate_water(self, room_type: str, water_running: bool) -> float:
-        """Calculate water usage in liters per hour."""
-        if not water_running:
-            return 0.0
-        
-        usage_rates = {
-            "bathroom": 120.0,  # Multiple fixtures
-            "cafeteria": 200.0,  # Dishwashing, cooking
-            "lab": 50.0,
-            "classroom": 10.0
-        }
-        return usage_rates.get(room_type, 0.0)
-    
-    def _calculate_co2(self, occupancy: int, capacity: int) -> int:
-        """Calculate estimated CO2 levels."""
-        base_co2 = 400  # Outdoor ambient
-        per_person = 100  # CO2 contribution per person
-        crowding_factor = (occupancy / max(capacity, 1)) * 200
-        
-        return int(base_co2 + (occupancy * per_person) + crowding_factor)
-    
-    def _determine_thermal_load(self, comfort: str) -> str:
-        """Determine if HVAC should heat or cool."""
-        if comfort == "too_cold":
-            return "heating"
-        elif comfort == "too_hot":
-            return "cooling"
-        return "neutral"
-    
-    def _extract_anomalies(self, llm_response: str) -> List[str]:
+    @staticmethod
+    def _extract_anomalies(llm_response: str) -> List[str]:
         """Extract anomalies from LLM response."""
         # Simple keyword extraction (can be enhanced)
-        anomaly_keywords = ["unusual", "anomaly", "unexpected", "high", "waste"]
-        anomalies = []
-        
-        for line in llm_response.split('\n'):
-            if any(keyword in line.lower() for keyword in anomaly_keywords):
-                anomalies.append(line.strip())
-        
-        return anomalies[:3]  # Top 3
+        return [line.strip() for line in llm_response.splitlines() if _ANOMALY_RE.search(line)][:3]  # Top 3
     
-    def _format_history(self, history: List[Dict]) -> str:
+    @staticmethod
+    def _format_history(history: List[Dict]) -> str:
         """Format historical data for LLM."""
         if not history:
             return "No historical data available"
@@ -386,76 +404,125 @@ Format each as: "ACTION: specific recommendation (estimated X% savings)"
             for h in history[-5:]  # Last 5 entries
         ])
     
-    def _predict_occupancy_heuristic(self, state: RoomState) -> int:
-        """Simple heuristic for occupancy prediction."""
-        current = state['current_occupancy']
-        capacity = state['capacity']
-        
-        # Simple trend: assume slight decrease off-peak, increase at peak
-        hour = datetime.now().hour
-        
-        if 9 <= hour < 17:  # Peak hours
-            return min(int(current * 1.1), capacity)
-        else:
-            return max(int(current * 0.8), 0)
+    @staticmethod
+    def _parse_recommendations(llm_response: str) -> List[str]:
+        """Parse recommendations from LLM response."""
+        return [line.strip() for line in llm_response.splitlines() if _RECOMMENDATION_RE.search(line)][:5]  # Top 5
+
+
+class RoomAgentBatchRunner:
+    """
+    Run many room agents step by step, batching each step across rooms.
     
-    def _get_max_energy(self, room_type: str) -> float:
-        """Maximum energy for room at full capacity."""
-        return {
-            "classroom": 5.0,
-            "lab": 15.0,
-            "library": 6.0,
-            "dorm": 3.0,
-            "bathroom": 2.0,
-            "cafeteria": 30.0
-        }.get(room_type, 5.0)
-    
-    def _find_peak_time(self, state: RoomState) -> str:
-        """Find predicted peak usage time."""
-        room_type = state['room_type']
-        
-        peak_times = {
-            "classroom": "10:00-11:00",
-            "lab": "14:00-16:00",
-            "library": "19:00-21:00",
-            "dorm": "21:00-23:00",
-            "bathroom": "08:00-09:00",
-            "cafeteria": "12:00-13:00"
-        }
-        
-        return peak_times.get(room_type, "12:00-13:00")
+    The runner collects the prompts of the three independent steps for every
+    room and dispatches them as one batch, then does the same for the
+    recommendation step. This is the only pipeline that runs room agents.
     
-    def _parse_recommendations(self, llm_response: str) -> List[str]:
-        """Parse recommendations from LLM response."""
-        recommendations = []
-        
-        for line in llm_response.split('\n'):
-            if line.strip() and ('ACTION:' in line or any(c.isdigit() and '%' in line for c in line)):
-                recommendations.append(line.strip())
-        
-        return recommendations[:5]  # Top 5
+    Step results are collected as per-room deltas and merged into the caller's
+    states in place once a room has finished, so no state is ever copied.
+    """
     
-    def _calculate_savings_potential(self, state: RoomState) -> float:
-        """Calculate potential savings percentage."""
-        # Simple heuristic based on anomalies and inefficiencies
-        savings = 0.0
-        
-        if state['anomalies']:
-            savings += len(state['anomalies']) * 5.0
-        
-        if state['temperature_comfort'] != 'comfortable':
-            savings += 10.0
-        
-        occupancy_ratio = state['current_occupancy'] / max(state['capacity'], 1)
-        if occupancy_ratio < 0.3 and state['estimated_energy_kw'] > 2.0:
-            savings += 15.0  # Low occupancy but high energy
-        
-        return min(savings, 40.0)  # Cap at 40%
+    def __init__(self, semaphore: Optional[asyncio.Semaphore] = None):
+        self.llm = get_llm()
+        self.semaphore = semaphore
     
-    def run(self, initial_state: RoomState) -> RoomState:
-        """Run the agent's reasoning pipeline."""
-        return self.graph.invoke(initial_state)
+    async def run_all(
+        self,
+        agents: List[RoomAgent],
+        states: List[RoomState],
+        budget_level: str = 'medium',
+        budget: Optional[BudgetManager] = None
+    ) -> List[RoomState]:
+        """
+        Run all agents, updating their states in place; failed rooms keep their initial state.
+        
+        budget_level ('low', 'medium' or 'high') and the token budget (None means
+        unlimited) apply to this call only, so concurrent analyses sharing pooled
+        agents each keep their own depth and are charged to their own budget.
+        """
+        deltas: List[Dict[str, Any]] = [{} for _ in states]
+        # Read-through views: a room's updates so far, falling back to its initial state
+        views = [ChainMap(delta, state) for delta, state in zip(deltas, states)]
+        failed = [False] * len(agents)
+        
+        # Phase 1: anomaly analysis, resource inference and demand prediction for every room
+        jobs = []  # (room index, step, prompt)
+        batch = RoomBatch(states)
+        all_estimates = resource_estimates_all(batch)
+        all_predictions = demand_predictions_all(batch)
+        for i, (agent, state, estimates) in enumerate(zip(agents, states, all_estimates)):
+            deltas[i].update(estimates)
+            deltas[i].update(all_predictions[i])
+            
+            observation_prompt = agent._observation_messages(state, budget_level)
+            if observation_prompt is None:
+                deltas[i].update(agent._apply_observation_analysis(state, None))
+            else:
+                jobs.append((i, "observations", observation_prompt))
+            inference_prompt = agent._inference_messages(state, estimates, budget_level)
+            if inference_prompt is not None:
+                jobs.append((i, "inference", inference_prompt))
+            jobs.append((i, "prediction", agent._prediction_messages(state)))
+        
+        responses = await self._invoke_all([(step, prompt) for _, step, prompt in jobs], budget)
+        for (i, step, prompt), response in zip(jobs, responses):
+            if isinstance(response, Exception):
+                failed[i] = True
+                print(f"⚠️  Error in room {agents[i].room_id} ({step}): {response}")
+                continue
+            if step == "observations":
+                content = response.content if response is not None else None
+                deltas[i].update(agents[i]._apply_observation_analysis(states[i], content))
+            if response is None:
+                continue  # Over budget: the heuristic values stand
+            deltas[i]["messages"] = _cap(views[i].get("messages", []), [*prompt, response])
+        
+        # Phase 2: recommendations, for rooms that got through phase 1
+        jobs = []
+        for i, agent in enumerate(agents):
+            if failed[i]:
+                continue
+            recommendation_prompt = agent._recommendation_messages(views[i], budget_level)
+            if recommendation_prompt is None:
+                deltas[i].update(agent._apply_recommendations(views[i], None))
+            else:
+                jobs.append((i, "recommendations", recommendation_prompt))
+        
+        responses = await self._invoke_all([(step, prompt) for _, step, prompt in jobs], budget)
+        for (i, step, prompt), response in zip(jobs, responses):
+            if isinstance(response, Exception):
+                failed[i] = True
+                print(f"⚠️  Error in room {agents[i].room_id} ({step}): {response}")
+                continue
+            if response is None:
+                deltas[i].update(agents[i]._apply_recommendations(views[i], None))
+                continue
+            deltas[i].update(agents[i]._apply_recommendations(views[i], response.content))
+            deltas[i]["messages"] = _cap(views[i].get("messages", []), [*prompt, response])
+        
+        # Failed rooms are left at their initial state
+        savings = savings_potentials_all(batch, views)
+        for i, state in enumerate(states):
+            if not failed[i]:
+                deltas[i]["savings_potential"] = savings[i]
+                state.update(deltas[i])
+        return states
     
-    async def run_async(self, initial_state: RoomState) -> RoomState:
-        """Async version for concurrent execution."""
-        return await self.graph.ainvoke(initial_state)
+    async def _invoke_all(
+        self,
+        requests: List[Tuple[str, List[BaseMessage]]],
+        budget: Optional[BudgetManager]
+    ) -> List[Any]:
+        """
+        Send a batch of (step, prompt) requests concurrently, charged to one budget.
+        
+        Exceptions are returned in place, and None marks a prompt skipped
+        because the budget was exhausted.
+        """
+        async def invoke(step: str, prompt: List[BaseMessage]):
+            if self.semaphore is None:
+                return await _invoke_within_budget(self.llm, prompt, budget, step)
+            async with self.semaphore:
+                return await _invoke_within_budget(self.llm, prompt, budget, step)
+        
+        return await asyncio.gather(*[invoke(*request) for request in requests], return_exceptions=True)
@@ -32,7 +32,7 @@ class DataService:
         return self.campus_data
     
     def get_current_observations(self) -> Dict[str, Any]:
-        """Get current room observations."""
+        """Get current room observations (the in-memory snapshot built at load time; no I/O)."""
         return self.current_observations
     
     def apply_environmental_params(self, data: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
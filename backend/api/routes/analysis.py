@@ -19,8 +19,7 @@ def generate_ai_recommendations(building_states: Dict, total_energy: float, tota
     recommendations = []
     
     # Find highest energy consuming buildings
-    sorted_buildings = sorted(building_states.items(), key=lambda x: x[1].get("total_energy_kw", 0), reverse=True)
-    top_building = sorted_buildings[0] if sorted_buildings else None
+    top_building = max(building_states.items(), key=lambda x: x[1].get("total_energy_kw", 0), default=None)
     
     # Find underutilized buildings (low occupancy)
     underutilized = [
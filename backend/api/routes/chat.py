@@ -1,13 +1,43 @@
 """Chat endpoint - AI assistant for analysis reports."""
+import json
+from functools import lru_cache
+
 from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel, Field
-from typing import Dict, Any, List, Optional
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Dict, Any, List, Optional, Union, AsyncIterator
 from langchain_groq import ChatGroq
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from config import settings
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
+from agents.llm import get_llm
+from config import Settings, get_settings
 
 router = APIRouter()
 
+# Kept byte-identical across requests so the provider can cache the prompt prefix;
+# the analysis data goes in the first user message instead
+CHAT_SYSTEM_PROMPT = """You are a helpful sustainability AI assistant for a campus energy management system called EcoAgent. 
+
+You have access to the COMPLETE analysis data in the ANALYSIS DATA message. ALWAYS use this data to answer questions. DO NOT say data is unavailable when it's provided there.
+
+Your role is to:
+- Answer questions DIRECTLY using the analysis data
+- When asked about savings potential, use the percentage and kW values shown in the data
+- Explain what the metrics mean and their implications
+- Provide actionable insights based on the recommendations
+- Be specific and reference actual numbers from the data
+- Keep responses brief (2-4 sentences) unless asked for details
+
+IMPORTANT: The analysis data contains all the information you need. Reference specific numbers when answering."""
+
+# Messages of prior conversation sent back to the model
+CHAT_HISTORY_LIMIT = 20
+
+# Enough for the "2-4 sentences" the prompt asks for, plus a detailed answer when requested
+CHAT_MAX_TOKENS = 400
+
+# Reply used when no Groq key is configured, built once instead of per request
+KEY_MISSING_MESSAGE = "⚠️ Groq API key not configured. Please set GROQ_API_KEY in your environment or .env file."
+
 
 class ChatMessage(BaseModel):
     """Chat message."""
@@ -15,11 +45,61 @@ class ChatMessage(BaseModel):
     content: str
 
 
+class CampusMetrics(BaseModel):
+    """Campus-wide metrics from an analysis report."""
+    model_config = ConfigDict(extra='ignore')
+    
+    total_energy_kw: Optional[float] = None
+    total_occupancy: Optional[int] = None
+    total_water_lph: Optional[float] = None
+    estimated_cost_per_hour: Optional[float] = None
+    potential_savings_percent: Optional[float] = None
+    avg_occupancy_rate: Optional[float] = None
+
+
+class BuildingSummary(BaseModel):
+    """Per-building fields the assistant reads (room states are not parsed)."""
+    model_config = ConfigDict(extra='ignore')
+    
+    total_energy_kw: Optional[float] = None
+    occupancy_rate: Optional[float] = None
+    savings_potential: Optional[float] = None
+
+
+class CriticalBuilding(BaseModel):
+    """High-priority building entry."""
+    model_config = ConfigDict(extra='ignore')
+    
+    building_id: Optional[str] = None
+    reason: Optional[str] = None
+    energy_kw: Optional[float] = None
+
+
+class ExecutionInfo(BaseModel):
+    """Scope of the analysis run."""
+    model_config = ConfigDict(extra='ignore')
+    
+    rooms_analyzed: Optional[int] = None
+    buildings_analyzed: Optional[int] = None
+
+
+class AnalysisData(BaseModel):
+    """The parts of an analysis/report the assistant uses as context."""
+    model_config = ConfigDict(extra='ignore')
+    
+    campus_metrics: Optional[CampusMetrics] = None
+    building_states: Optional[Dict[str, BuildingSummary]] = None
+    campus_recommendations: Optional[List[str]] = None
+    critical_buildings: List[CriticalBuilding] = Field(default_factory=list)
+    execution_info: Optional[ExecutionInfo] = None
+
+
 class ChatRequest(BaseModel):
     """Chat request with context."""
     message: str
-    analysis_data: Dict[str, Any]  # The analysis/report data
+    analysis_data: AnalysisData  # The analysis/report data
     chat_history: List[ChatMessage] = Field(default_factory=list)
+    stream: bool = False  # Stream the reply as server-sent events instead of one JSON response
 
 
 class ChatResponse(BaseModel):
@@ -29,164 +109,156 @@ class ChatResponse(BaseModel):
 
 
 @router.post("/message", response_model=ChatResponse)
-async def send_message(request: ChatRequest) -> ChatResponse:
+async def send_message(
+    request: ChatRequest,
+    settings: Settings = Depends(get_settings)
+) -> Union[ChatResponse, StreamingResponse]:
     """
     Send a message to the AI assistant about the analysis report.
     The assistant has context of the current analysis data.
+    With stream=true the reply is sent as server-sent events as it is generated.
     """
+    if not settings.groq_api_key:
+        return _reply(request.chat_history, request.message, KEY_MISSING_MESSAGE)
+    
+    # Shared Groq LLM (connection pool stays warm between messages)
+    llm = get_llm()
+    
+    # Static instructions first, then the per-report analysis data
+    messages = [
+        SystemMessage(content=CHAT_SYSTEM_PROMPT),
+        HumanMessage(content=f"ANALYSIS DATA:\n{_summary_for(request.analysis_data.model_dump_json())}")
+    ]
+    
+    # Convert chat history to LangChain messages; only the most recent turns are
+    # sent to the model, the client keeps the full transcript
+    for msg in request.chat_history[-CHAT_HISTORY_LIMIT:]:
+        if msg.role == "user":
+            messages.append(HumanMessage(content=msg.content))
+        elif msg.role == "assistant":
+            messages.append(AIMessage(content=msg.content))
+    
+    # Add current user message
+    messages.append(HumanMessage(content=request.message))
+    
+    if request.stream:
+        return StreamingResponse(
+            _stream_reply(llm, messages),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"}
+        )
+    
     try:
-        # Initialize Groq LLM
-        if not settings.groq_api_key:
-            return ChatResponse(
-                message="⚠️ Groq API key not configured. Please set GROQ_API_KEY in your environment or .env file.",
-                chat_history=request.chat_history + [
-                    ChatMessage(role="user", content=request.message),
-                    ChatMessage(role="assistant", content="⚠️ Groq API key not configured. Please set GROQ_API_KEY in your environment or .env file.")
-                ]
-            )
-        
-        try:
-            llm = ChatGroq(
-                model=settings.agent_model,
-                temperature=settings.agent_temperature,
-                api_key=settings.groq_api_key
-            )
-        except Exception as e:
-            return ChatResponse(
-                message=f"⚠️ Failed to initialize Groq: {str(e)}",
-                chat_history=request.chat_history + [
-                    ChatMessage(role="user", content=request.message),
-                    ChatMessage(role="assistant", content=f"⚠️ Failed to initialize Groq: {str(e)}")
-                ]
-            )
-        
-        # Create system prompt with analysis context
-        analysis_summary = _create_analysis_summary(request.analysis_data)
-        
-        system_prompt = f"""You are a helpful sustainability AI assistant for a campus energy management system called EcoAgent. 
-
-You have access to the COMPLETE analysis data below. ALWAYS use this data to answer questions. DO NOT say data is unavailable when it's provided below.
+        response = await llm.ainvoke(messages, max_tokens=CHAT_MAX_TOKENS)
+    except Exception as e:
+        print(f"❌ Chat error: {e}")
+        # Return user-friendly error instead of raising exception
+        return _reply(request.chat_history, request.message, _chat_error_message(e))
+    
+    return _reply(request.chat_history, request.message, response.content)
 
-{analysis_summary}
 
-Your role is to:
-- Answer questions DIRECTLY using the data provided above
-- When asked about savings potential, use the percentage and kW values shown in the data
-- Explain what the metrics mean and their implications
-- Provide actionable insights based on the recommendations
-- Be specific and reference actual numbers from the data
-- Keep responses brief (2-4 sentences) unless asked for details
+def _reply(history: List[ChatMessage], user_message: str, assistant_message: str) -> ChatResponse:
+    """Build the response with the exchange appended to the full history."""
+    return ChatResponse(message=assistant_message, chat_history=history + [
+        ChatMessage(role="user", content=user_message),
+        ChatMessage(role="assistant", content=assistant_message)
+    ])
 
-IMPORTANT: The data above contains all the information you need. Reference specific numbers when answering."""
 
-        # Convert chat history to LangChain messages
-        messages = [SystemMessage(content=system_prompt)]
-        
-        for msg in request.chat_history:
-            if msg.role == "user":
-                messages.append(HumanMessage(content=msg.content))
-            elif msg.role == "assistant":
-                messages.append(AIMessage(content=msg.content))
-        
-        # Add current user message
-        messages.append(HumanMessage(content=request.message))
-        
-        # Get response from LLM
-        response = llm.invoke(messages)
-        assistant_message = response.content
-        
-        # Update chat history
-        new_history = request.chat_history + [
-            ChatMessage(role="user", content=request.message),
-            ChatMessage(role="assistant", content=assistant_message)
-        ]
-        
-        return ChatResponse(
-            message=assistant_message,
-            chat_history=new_history
-        )
-        
+async def _stream_reply(llm: ChatGroq, messages: List[BaseMessage]) -> AsyncIterator[str]:
+    """Yield the assistant reply as server-sent events, one per streamed chunk."""
+    try:
+        async for chunk in llm.astream(messages, max_tokens=CHAT_MAX_TOKENS):
+            if chunk.content:
+                yield f"data: {json.dumps(chunk.content)}\n\n"
     except Exception as e:
-        print(f"❌ Chat error: {e}")
-        # Return user-friendly error instead of raising exception
-        error_message = f"⚠️ Chat error: {str(e)}. Make sure your Groq API key is configured correctly."
-        return ChatResponse(
-            message=error_message,
-            chat_history=request.chat_history + [
-                ChatMessage(role="user", content=request.message),
-                ChatMessage(role="assistant", content=error_message)
-            ]
-        )
+        print(f"❌ Chat stream error: {e}")
+        yield f"event: error\ndata: {json.dumps(_chat_error_message(e))}\n\n"
+    
+    yield "event: done\ndata: {}\n\n"
+
+
+def _chat_error_message(error: Exception) -> str:
+    """User-friendly text for a failed LLM call."""
+    return f"⚠️ Chat error: {str(error)}. Make sure your Groq API key is configured correctly."
+
+
+def _na(value: Any) -> Any:
+    """Render a missing metric as 'N/A'."""
+    return 'N/A' if value is None else value
+
+
+@lru_cache(maxsize=256)
+def _summary_for(analysis_json: str) -> str:
+    """Analysis summary keyed by the parsed payload, so follow-up messages reuse it."""
+    return _create_analysis_summary(AnalysisData.model_validate_json(analysis_json))
 
 
-def _create_analysis_summary(data: Dict[str, Any]) -> str:
+def _create_analysis_summary(data: AnalysisData) -> str:
     """Create a concise summary of the analysis data for the AI."""
     summary_parts = []
     
     # Campus metrics
-    if "campus_metrics" in data:
-        metrics = data["campus_metrics"]
-        total_energy = metrics.get('total_energy_kw', 'N/A')
-        savings_pct = metrics.get('potential_savings_percent', 'N/A')
-        cost_per_hour = metrics.get('estimated_cost_per_hour', 'N/A')
+    if data.campus_metrics is not None:
+        metrics = data.campus_metrics
+        total_energy = metrics.total_energy_kw
+        savings_pct = metrics.potential_savings_percent
+        cost_per_hour = metrics.estimated_cost_per_hour
         
         # Calculate potential savings
-        if isinstance(total_energy, (int, float)) and isinstance(savings_pct, (int, float)):
+        potential_energy_savings = 'N/A'
+        potential_cost_savings = 'N/A'
+        if total_energy is not None and savings_pct is not None:
             potential_energy_savings = round(total_energy * (savings_pct / 100), 2)
-            if isinstance(cost_per_hour, (int, float)):
+            if cost_per_hour is not None:
                 potential_cost_savings = round(cost_per_hour * (savings_pct / 100), 2)
-            else:
-                potential_cost_savings = 'N/A'
-        else:
-            potential_energy_savings = 'N/A'
-            potential_cost_savings = 'N/A'
         
         summary_parts.append(f"""CAMPUS OVERVIEW:
-- Current Total Energy Usage: {total_energy} kW
-- Total Occupancy: {metrics.get('total_occupancy', 'N/A')} people
-- Water Usage: {metrics.get('total_water_lph', 'N/A')} L/hr
-- Current Cost: ${cost_per_hour}/hour
-- SAVINGS POTENTIAL: {savings_pct}% (this means {potential_energy_savings} kW or ${potential_cost_savings}/hour can be saved)
-- Average Occupancy Rate: {metrics.get('avg_occupancy_rate', 'N/A')}%""")
+- Current Total Energy Usage: {_na(total_energy)} kW
+- Total Occupancy: {_na(metrics.total_occupancy)} people
+- Water Usage: {_na(metrics.total_water_lph)} L/hr
+- Current Cost: ${_na(cost_per_hour)}/hour
+- SAVINGS POTENTIAL: {_na(savings_pct)}% (this means {potential_energy_savings} kW or ${potential_cost_savings}/hour can be saved)
+- Average Occupancy Rate: {_na(metrics.avg_occupancy_rate)}%""")
     
     # Building states with detailed savings info
-    if "building_states" in data:
-        buildings = data["building_states"]
+    if data.building_states is not None:
+        buildings = data.building_states
         summary_parts.append(f"\nBUILDINGS ANALYZED ({len(buildings)} total):")
         for bid, bdata in list(buildings.items())[:3]:  # First 3 buildings
-            savings = bdata.get('savings_potential', 'N/A')
-            energy = bdata.get('total_energy_kw', 'N/A')
+            savings = bdata.savings_potential
+            energy = bdata.total_energy_kw
             summary_parts.append(f"- {bid}:")
-            summary_parts.append(f"  * Energy: {energy} kW")
-            summary_parts.append(f"  * Occupancy: {bdata.get('occupancy_rate', 'N/A')}%")
-            summary_parts.append(f"  * Savings Potential: {savings}%")
-            if isinstance(energy, (int, float)) and isinstance(savings, (int, float)):
+            summary_parts.append(f"  * Energy: {_na(energy)} kW")
+            summary_parts.append(f"  * Occupancy: {_na(bdata.occupancy_rate)}%")
+            summary_parts.append(f"  * Savings Potential: {_na(savings)}%")
+            if energy is not None and savings is not None:
                 potential = round(energy * (savings / 100), 2)
                 summary_parts.append(f"  * Can save: {potential} kW")
     
     # Recommendations with context
-    if "campus_recommendations" in data:
-        recs = data["campus_recommendations"]
+    if data.campus_recommendations is not None:
         summary_parts.append(f"\nTOP RECOMMENDATIONS FOR SAVINGS:")
-        for i, rec in enumerate(recs[:5], 1):
+        for i, rec in enumerate(data.campus_recommendations[:5], 1):
             summary_parts.append(f"{i}. {rec}")
     
     # Critical buildings
-    if "critical_buildings" in data and data["critical_buildings"]:
+    if data.critical_buildings:
         summary_parts.append(f"\nHIGH PRIORITY BUILDINGS (need immediate attention):")
-        for building in data["critical_buildings"][:3]:
-            summary_parts.append(f"- {building.get('building_id', 'N/A')}: {building.get('reason', 'N/A')} ({building.get('energy_kw', 'N/A')} kW)")
+        for building in data.critical_buildings[:3]:
+            summary_parts.append(f"- {_na(building.building_id)}: {_na(building.reason)} ({_na(building.energy_kw)} kW)")
     
     # Execution info
-    if "execution_info" in data:
-        info = data["execution_info"]
-        summary_parts.append(f"\nANALYSIS SCOPE: {info.get('rooms_analyzed', 'N/A')} rooms across {info.get('buildings_analyzed', 'N/A')} buildings")
+    if data.execution_info is not None:
+        info = data.execution_info
+        summary_parts.append(f"\nANALYSIS SCOPE: {_na(info.rooms_analyzed)} rooms across {_na(info.buildings_analyzed)} buildings")
     
     return "\n".join(summary_parts)
 
 
 @router.get("/models")
-async def check_models() -> Dict[str, Any]:
+async def check_models(settings: Settings = Depends(get_settings)) -> Dict[str, Any]:
     """Check Groq configuration status."""
     groq_configured = bool(settings.groq_api_key)
     
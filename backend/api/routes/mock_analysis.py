@@ -207,8 +207,7 @@ def generate_ai_recommendations(building_states, total_energy, total_occupancy,
     recommendations = []
     
     # Find highest energy consuming buildings
-    sorted_buildings = sorted(building_states.items(), key=lambda x: x[1]["total_energy_kw"], reverse=True)
-    top_building = sorted_buildings[0] if sorted_buildings else None
+    top_building = max(building_states.items(), key=lambda x: x[1]["total_energy_kw"], default=None)
     
     # Find underutilized buildings (low occupancy)
     underutilized = [
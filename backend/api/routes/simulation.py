@@ -1,65 +1,82 @@
 """Simulation endpoints - what-if scenarios."""
-from fastapi import APIRouter, Depends, Request, HTTPException
+from fastapi import APIRouter, Depends, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.exceptions import RequestValidationError
-from pydantic import BaseModel, Field, ValidationError
-from typing import Dict, Any, List, Optional
-import json
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, field_validator
+from typing import Dict, Any, List, Optional, Tuple, Union, AsyncIterator, Awaitable, Callable
+import asyncio
+import hashlib
+import logging
+
+import orjson
 
 from api.dependencies import get_campus_graph, get_data_service
 from agents.campus_graph import CampusAgentGraph
 from api.data_service import DataService
+from api.responses import ORJSONResponse
+from config import Settings, get_settings
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
 class SimulationScenario(BaseModel):
     """What-if simulation scenario."""
-    model_config = {"extra": "allow"}  # Allow extra fields
+    model_config = ConfigDict(extra="ignore", frozen=True)  # Unknown fields are dropped, not stored
     
     name: str
     type: str  # close_building, reduce_hvac, shift_schedule
     building_id: Optional[str] = Field(default=None)
-    parameters: Optional[Dict[str, Any]] = Field(default=None)
+    parameters: Dict[str, Any] = Field(default_factory=dict)
+    
+    @field_validator("parameters", mode="before")
+    @classmethod
+    def _none_as_empty(cls, value: Any) -> Any:
+        """Treat an explicit null the same as no parameters."""
+        return {} if value is None else value
+
+
+class ScenarioTemplate(BaseModel):
+    """Pre-defined what-if scenario offered to the frontend."""
+    model_config = ConfigDict(frozen=True)
+    
+    id: str
+    name: str
+    type: str
+    description: str
+    estimated_impact: str
 
 
-@router.post("/run")
+# Dumps a whole /compare request in one serializer call instead of one per scenario
+_SCENARIO_LIST = TypeAdapter(List[SimulationScenario])
+
+
+@router.post("/run", response_model=None, response_class=ORJSONResponse)
 async def run_simulation(
+    scenario: SimulationScenario,
     request: Request,
     campus_graph: CampusAgentGraph = Depends(get_campus_graph),
-    data_service: DataService = Depends(get_data_service)
-) -> Dict[str, Any]:
-    """Run a what-if simulation scenario."""
-    try:
-        # Get and log raw body
-        body = await request.json()
-        print(f"📥 Received raw body: {json.dumps(body, indent=2)}")
-        
-        # Try to parse the scenario
-        scenario = SimulationScenario(**body)
-        print(f"✅ Parsed scenario: {scenario}")
-        
-    except ValidationError as e:
-        print(f"❌ Validation error: {e}")
-        raise HTTPException(status_code=422, detail=str(e))
-    except Exception as e:
-        print(f"❌ Unexpected error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    data_service: DataService = Depends(get_data_service),
+    settings: Settings = Depends(get_settings)
+) -> ORJSONResponse:
+    """Run a what-if simulation scenario (FastAPI validates the body, 422 on bad input)."""
+    # __debug__ is False under python -O, which removes this block from the bytecode
+    if __debug__ and settings.debug_log_bodies and logger.isEnabledFor(logging.DEBUG):
+        # Starlette keeps the body it already read; this is not a second parse
+        logger.debug("📥 Received raw body: %s", (await request.body()).decode())
+    logger.debug("✅ Parsed scenario: %s", scenario)
     
     current_data = data_service.get_current_observations()
     
+    scenario_dict = scenario.model_dump()
+    
     # Extract custom parameters
-    params = scenario.parameters or {}
+    params = scenario_dict["parameters"]
     num_rooms = params.get('num_rooms', None)
     num_buildings = params.get('num_buildings', None)
     budget_level = params.get('budget_level', 'medium')
     
-    scenario_dict = {
-        "name": scenario.name,
-        "type": scenario.type,
-        "building_id": scenario.building_id,
-        "parameters": scenario.parameters or {}
-    }
-    
     # Run simulation with budget constraints
     result = await campus_graph.run_what_if_simulation(
         scenario_dict, 
@@ -69,77 +86,138 @@ async def run_simulation(
         budget_level=budget_level
     )
     
-    return result
+    # Returned as a response so the result goes straight to orjson, skipping jsonable_encoder
+    return ORJSONResponse(result)
+
+
+# Pre-defined scenarios never change at runtime; encode them and their ETag once
+SCENARIO_TEMPLATES = (
+    ScenarioTemplate(
+        id="close_building_night",
+        name="Close Building After 8 PM",
+        type="close_building",
+        description="Simulate closing a building after 8 PM to save energy",
+        estimated_impact="15-25% building energy savings"
+    ),
+    ScenarioTemplate(
+        id="reduce_hvac_low_occupancy",
+        name="Reduce HVAC in Low Occupancy",
+        type="reduce_hvac",
+        description="Reduce HVAC in rooms with <30% occupancy",
+        estimated_impact="10-15% campus energy savings"
+    ),
+    ScenarioTemplate(
+        id="consolidate_classes",
+        name="Consolidate Evening Classes",
+        type="shift_schedule",
+        description="Move all evening classes to 2 buildings",
+        estimated_impact="20-30% evening energy savings"
+    )
+)
+
+_TEMPLATES_JSON = TypeAdapter(Tuple[ScenarioTemplate, ...]).dump_json(SCENARIO_TEMPLATES)
+_TEMPLATES_HEADERS = {
+    "ETag": f'"{hashlib.blake2b(_TEMPLATES_JSON, digest_size=8).hexdigest()}"',
+    "Cache-Control": "public, max-age=3600"
+}
 
 
-@router.get("/templates")
-async def get_scenario_templates() -> List[Dict[str, Any]]:
+@router.get("/templates", response_model=List[ScenarioTemplate])
+async def get_scenario_templates(request: Request) -> Response:
     """Get pre-defined simulation scenario templates."""
-    return [
-        {
-            "id": "close_building_night",
-            "name": "Close Building After 8 PM",
-            "type": "close_building",
-            "description": "Simulate closing a building after 8 PM to save energy",
-            "estimated_impact": "15-25% building energy savings"
-        },
-        {
-            "id": "reduce_hvac_low_occupancy",
-            "name": "Reduce HVAC in Low Occupancy",
-            "type": "reduce_hvac",
-            "description": "Reduce HVAC in rooms with <30% occupancy",
-            "estimated_impact": "10-15% campus energy savings"
-        },
-        {
-            "id": "consolidate_classes",
-            "name": "Consolidate Evening Classes",
-            "type": "shift_schedule",
-            "description": "Move all evening classes to 2 buildings",
-            "estimated_impact": "20-30% evening energy savings"
-        }
-    ]
+    if request.headers.get("if-none-match") == _TEMPLATES_HEADERS["ETag"]:
+        return Response(status_code=304, headers=_TEMPLATES_HEADERS)
+    return Response(_TEMPLATES_JSON, media_type="application/json", headers=_TEMPLATES_HEADERS)
 
 
 @router.post("/debug")
-async def debug_request(request: Request):
-    """Debug endpoint to see raw request."""
-    body = await request.json()
-    return {
-        "received": body,
-        "type": type(body).__name__,
-        "keys": list(body.keys()) if isinstance(body, dict) else None
-    }
+async def debug_request(request: Request) -> Response:
+    """
+    Debug endpoint to see raw request.
+    A JSON body is echoed back as-is, not re-encoded; any other body is
+    echoed as a JSON string.
+    """
+    raw = await request.body()
+    if not raw:
+        received = b"null"
+    elif request.headers.get("content-type", "").split(";")[0].strip() == "application/json":
+        received = raw
+    else:
+        received = orjson.dumps(raw.decode(errors="replace"))
+    return Response(
+        b'{"received":%b,"bytes":%d}' % (received, len(raw)),
+        media_type="application/json"
+    )
 
 
-@router.post("/compare")
+@router.post("/compare", response_model=None, response_class=ORJSONResponse)
 async def compare_scenarios(
     scenarios: List[SimulationScenario],
     campus_graph: CampusAgentGraph = Depends(get_campus_graph),
-    data_service: DataService = Depends(get_data_service)
-) -> Dict[str, Any]:
-    """Compare multiple simulation scenarios."""
+    data_service: DataService = Depends(get_data_service),
+    settings: Settings = Depends(get_settings)
+) -> Union[ORJSONResponse, StreamingResponse]:
+    """
+    Compare multiple simulation scenarios.
+    Results are streamed in the order the simulations finish, not ranked; the
+    best scenario is under "recommended". A scenario whose simulation fails is
+    reported as {"scenario", "error"} and never recommended.
+    """
+    if not scenarios:
+        return ORJSONResponse({"scenarios_compared": 0, "results": [], "recommended": None})
+    
     current_data = data_service.get_current_observations()
     
-    results = []
-    for scenario in scenarios:
-        scenario_dict = {
-            "name": scenario.name,
-            "type": scenario.type,
-            "building_id": scenario.building_id,
-            "parameters": scenario.parameters or {}
-        }
-        
-        result = await campus_graph.run_what_if_simulation(scenario_dict, current_data)
-        results.append({
-            "scenario": scenario.name,
+    scenario_dicts = _SCENARIO_LIST.dump_python(scenarios)
+    
+    # Scenarios are independent; run them together, a few at a time
+    semaphore = asyncio.Semaphore(settings.max_concurrent_sims)
+    
+    async def _run(scenario_dict: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            result = await campus_graph.run_what_if_simulation(scenario_dict, current_data)
+        return {
+            "scenario": scenario_dict["name"],
             "savings": result.get("comparison", {})
-        })
+        }
     
-    # Rank by energy savings
-    ranked = sorted(results, key=lambda x: x["savings"].get("energy_savings_pct", 0), reverse=True)
+    return StreamingResponse(_stream_comparison(_run, scenario_dicts), media_type="application/json")
+
+
+async def _stream_comparison(
+    run: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+    scenario_dicts: List[Dict[str, Any]]
+) -> AsyncIterator[bytes]:
+    """Yield each scenario's result as its simulation finishes, tracking the best one."""
+    async def settle(scenario_dict: Dict[str, Any]) -> Dict[str, Any]:
+        # The 200 status is already sent, so a failure becomes an entry, not a broken body
+        try:
+            return await run(scenario_dict)
+        except Exception as e:
+            logger.exception("❌ Simulation failed for scenario %r", scenario_dict["name"])
+            return {"scenario": scenario_dict["name"], "error": str(e)}
+    
+    tasks = [asyncio.create_task(settle(scenario_dict)) for scenario_dict in scenario_dicts]
+    best = None
+    best_savings = 0
+    separator = b""
+    
+    try:
+        yield b'{"results":['
+        for finished in asyncio.as_completed(tasks):
+            entry = await finished
+            yield separator + orjson.dumps(entry)
+            separator = b","
+            
+            # Rank by energy savings
+            if "error" in entry:
+                continue
+            savings = entry["savings"].get("energy_savings_pct", 0)
+            if best is None or savings > best_savings:
+                best, best_savings = entry, savings
+    finally:
+        # Client went away; don't leave the rest running
+        for task in tasks:
+            task.cancel()
     
-    return {
-        "scenarios_compared": len(scenarios),
-        "results": ranked,
-        "recommended": ranked[0] if ranked else None
-    }
+    yield b'],"scenarios_compared":%d,"recommended":%b}' % (len(scenario_dicts), orjson.dumps(best))
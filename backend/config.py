@@ -1,5 +1,6 @@
 """Configuration settings for EcoAgent backend."""
 import os
+from functools import lru_cache
 from pydantic_settings import BaseSettings
 
 
@@ -9,6 +10,8 @@ class Settings(BaseSettings):
     # API Settings
     api_host: str = "0.0.0.0"
     api_port: int = 8000
+    log_level: str = "INFO"
+    debug_log_bodies: bool = False  # With log_level DEBUG, log raw simulation request bodies
     
     # Groq Settings
     groq_api_key: str = ""
@@ -16,6 +19,13 @@ class Settings(BaseSettings):
     # Agent Settings
     agent_model: str = "llama-3.3-70b-versatile"
     agent_temperature: float = 0.7
+    max_concurrent_llm_calls: int = 16  # LLM requests in flight at once (Groq rate limits)
+    llm_max_retries: int = 3  # Retries with exponential backoff on 429/5xx
+    llm_max_connections: int = 200  # Connection pool size of the shared Groq client
+    llm_max_keepalive_connections: int = 100
+    tick_token_budget: int = 1_000_000  # Room-agent LLM tokens per campus analysis
+    tick_token_reserve: int = 50_000  # Fall back to heuristics once fewer tokens than this remain
+    max_concurrent_sims: int = 4  # Scenarios of one /simulation/compare request run at once
     
     # Data Settings
     data_dir: str = "./data"
@@ -25,4 +35,7 @@ class Settings(BaseSettings):
         case_sensitive = False
 
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Application settings, read from the environment and .env once per process."""
+    return Settings()
@@ -1,20 +1,52 @@
 """FastAPI application for EcoAgent."""
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from contextlib import asynccontextmanager
+from typing import Tuple
+from logging.handlers import QueueHandler, QueueListener
+import logging
+import queue
 import uvicorn
 
 from agents.campus_graph import CampusAgentGraph
+from agents.room_agent import get_skipped_llm_calls
 from api.routes import campus, analysis, simulation, mock_analysis, chat
 from api.data_service import DataService
 from api import dependencies
-from config import settings
+from api.responses import ORJSONResponse
+from config import get_settings
+
+
+def _start_log_listener() -> Tuple[QueueListener, QueueHandler]:
+    """Send log records through a queue so writing them never blocks the event loop."""
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    
+    queue_handler = QueueHandler(log_queue)
+    root_logger = logging.getLogger()
+    root_logger.addHandler(queue_handler)
+    root_logger.setLevel(get_settings().log_level.upper())
+    # The Groq client logs every request at INFO through httpx
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener, queue_handler
+
+
+def _stop_log_listener(listener: QueueListener, queue_handler: QueueHandler):
+    """Flush queued records and detach the queue from the root logger."""
+    listener.stop()
+    logging.getLogger().removeHandler(queue_handler)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize and cleanup application lifecycle."""
     print("🚀 Starting EcoAgent Backend...")
+    log_listener, log_handler = _start_log_listener()
     
     # Initialize data service
     data_service = DataService()
@@ -33,6 +65,7 @@ async def lifespan(app: FastAPI):
     
     # Cleanup
     print("👋 Shutting down EcoAgent Backend...")
+    _stop_log_listener(log_listener, log_handler)
 
 
 # Create FastAPI app
@@ -40,21 +73,27 @@ app = FastAPI(
     title="EcoAgent API",
     description="Agentic AI system for campus sustainability management",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
+# Compress larger JSON responses (analysis and simulation results); added before
+# CORS so it runs inside it and preflights are answered without touching it
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=4)
+
 # Configure CORS for frontend
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
+    allow_origins=frozenset({
         "http://localhost:5173",  # Local dev (Vite)
         "http://localhost:3000",  # Local dev alternative
         "https://ecoagent-clei.onrender.com",  # Deployed backend
         "*"  # Allow all origins for now (restrict in production)
-    ],
+    }),
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=("GET", "POST", "OPTIONS"),  # The API only exposes GET and POST routes
+    allow_headers=("content-type", "authorization"),
+    max_age=86400,  # Browsers reuse a preflight for 24h
 )
 
 # Include routers
@@ -81,11 +120,13 @@ async def health_check():
     return {
         "status": "healthy",
         "campus_initialized": dependencies.campus_graph is not None,
-        "data_loaded": dependencies.data_service is not None
+        "data_loaded": dependencies.data_service is not None,
+        "skipped_room_llm_calls": get_skipped_llm_calls()
     }
 
 
 if __name__ == "__main__":
+    settings = get_settings()
     uvicorn.run(
         "main:app",
         host=settings.api_host,